@@ -1,69 +1,137 @@
-import base64
+import asyncio
+import logging
 from io import BytesIO
 
 import aiohttp
+import pybase64
 from aiohttp.client_exceptions import InvalidUrlClientError
 from PIL import Image
+from scrapy.utils.defer import deferred_from_coro
+from turbojpeg import TJFLAG_PROGRESSIVE, TJPF_RGB, TurboJPEG
+
+JPEG_SOI = b"\xff\xd8"
+
+logger = logging.getLogger(__name__)
 
 
 class PhotoDownloaderPipeline:
-    def __init__(self, result_image_quality: int):
+    def __init__(self, result_image_quality: int, jpeg_subsampling: int):
         self.result_image_quality = result_image_quality
+        # 0 — 4:4:4, 1 — 4:2:2, 2 — 4:2:0 (нумерация совпадает у PIL и turbojpeg)
+        self.jpeg_subsampling = jpeg_subsampling
+        self.session = None
+        try:
+            self.tj = TurboJPEG()
+        except (OSError, RuntimeError) as e:
+            # нет нативной libturbojpeg — краулинг не роняем, жмём всё через PIL
+            logger.warning("libturbojpeg is unavailable, falling back to Pillow: %s", e)
+            self.tj = None
 
     @classmethod
     def from_crawler(cls, crawler):
         result_image_quality = crawler.settings.get("RESULT_IMAGE_QUALITY", 35)
-        return cls(result_image_quality=result_image_quality)
+        jpeg_subsampling = crawler.settings.getint("JPEG_SUBSAMPLING", 2)
+        return cls(result_image_quality=result_image_quality, jpeg_subsampling=jpeg_subsampling)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # одна сессия на весь краулинг: пул соединений, keep-alive и кэш DNS.
+        # Создаём лениво на первой загрузке — корутинный open_spider ждут не все версии Scrapy
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=64, ttl_dns_cache=300, keepalive_timeout=30),
+            )
+        return self.session
+
+    def close_spider(self, spider):
+        if self.session is None:
+            return None
+        session, self.session = self.session, None
+        # Deferred из close_spider Scrapy дожидается в любой версии
+        return deferred_from_coro(session.close())
 
     def compress_image(self, image_content: bytes):
-        input_buffer = BytesIO(image_content)
+        # JPEG пережимаем через libjpeg-turbo, остальное (png, gif, webp...) — через PIL
+        if self.tj is not None and image_content[:2] == JPEG_SOI:
+            try:
+                arr = self.tj.decode(image_content, pixel_format=TJPF_RGB)
+                return self.tj.encode(
+                    arr,
+                    quality=self.result_image_quality,
+                    pixel_format=TJPF_RGB,
+                    jpeg_subsample=self.jpeg_subsampling,
+                    flags=TJFLAG_PROGRESSIVE,
+                )
+            except OSError:
+                # битый/экзотический JPEG (например, CMYK) — пробуем через PIL
+                pass
+        return self._compress_image_pil(image_content)
+
+    def _compress_image_pil(self, image_content: bytes):
+        # BytesIO(bytes) разделяет исходный буфер, а getvalue() отдаёт внутренний bytes
+        # без копии (пока нет getbuffer()-view) — лишних копий тут нет
+        img = Image.open(BytesIO(image_content))
         output_buffer = BytesIO()
-        img = Image.open(input_buffer)
         if img.mode in ("RGBA", "P"):
             img = img.convert("RGB")
-        img.save(output_buffer, format="JPEG", quality=self.result_image_quality, optimize=True)
+        img.save(
+            output_buffer,
+            format="JPEG",
+            quality=self.result_image_quality,
+            optimize=True,
+            progressive=True,
+            subsampling=self.jpeg_subsampling,
+        )
         return output_buffer.getvalue()
 
     async def _download_photo_to_base64(self, url: str):
-        async with aiohttp.ClientSession() as session:
-            response = await session.get(url)
+        async with self._get_session().get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
             if response.status != 200:
                 return ""
             content = await response.read()
-            compressed_bytes = self.compress_image(image_content=content)
-            encoded_image = base64.b64encode(compressed_bytes).decode("utf-8")
-            return encoded_image
+        # пережатие — чистый CPU, уводим из event loop, чтобы не стопорить остальные загрузки
+        compressed_bytes = await asyncio.to_thread(self.compress_image, content)
+        encoded_image = pybase64.b64encode(compressed_bytes).decode("ascii")
+        return encoded_image
 
     async def process_item(self, item, spider):
-        # допускаем пустые/None
-        if item.get("header_photo_url"):
-            try:
-                photo_base64 = await self._download_photo_to_base64(item["header_photo_url"])
-            except InvalidUrlClientError:
-                item["header_photo_url"] = None
-                item["header_photo_base64"] = None
-                return item
-            item["header_photo_base64"] = photo_base64
-        else:
+        # допускаем пустые/None — тогда сразу отдаём дальше, ничего не ожидая
+        if not item.get("header_photo_url"):
+            item.setdefault("header_photo_base64", None)
+            return item
+
+        try:
+            photo_base64 = await self._download_photo_to_base64(item["header_photo_url"])
+        except InvalidUrlClientError:
+            item["header_photo_url"] = None
             item["header_photo_base64"] = None
+            return item
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            # фото не скачалось (таймаут, обрыв) — статью всё равно сохраняем, просто без фото
+            spider.logger.warning("Failed to download photo %s: %r", item["header_photo_url"], e)
+            item["header_photo_base64"] = None
+            return item
+        item["header_photo_base64"] = photo_base64
         return item
 
 
 
+import hashlib
 import os
 from datetime import datetime, timezone
 
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import DuplicateKeyError
+from pymongo import MongoClient, ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 
 
 class MongoPipeline:
-    def __init__(self, uri: str, db_name: str, collection_name: str):
+    def __init__(self, uri: str, db_name: str, collection_name: str, bulk_size: int):
         self.uri = uri
         self.db_name = db_name
         self.collection_name = collection_name
+        self.bulk_size = bulk_size
         self.client = None
         self.collection = None
+        self._buf = []
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -75,38 +143,85 @@ class MongoPipeline:
         host = crawler.settings.get("MONGO_HOST", "localhost")
         port = crawler.settings.get("MONGO_PORT", 27017)
         collection = crawler.settings.get("MONGO_COLLECTION", "kp_articles")
+        bulk_size = crawler.settings.getint("MONGO_BULK_SIZE", 100)
 
         uri = f"mongodb://{mongo_user}:{mongo_password}@{host}:{port}/?authSource={mongo_auth_source}"
-        return cls(uri=uri, db_name=mongo_db, collection_name=collection)
+        return cls(uri=uri, db_name=mongo_db, collection_name=collection, bulk_size=bulk_size)
 
     def open_spider(self, spider):
-        self.client = MongoClient(self.uri)
+        # краулинг пишет много и переживёт потерю хвоста: ждём только primary, без журнала
+        self.client = MongoClient(self.uri, w=1, journal=False, retryWrites=True)
         db = self.client[self.db_name]
         self.collection = db[self.collection_name]
-        # чтобы не было дублей по ссылке
-        self.collection.create_index([("source_url", ASCENDING)], unique=True)
+        # чтобы не было дублей по ссылке: ключ — sha1 от ссылки (20 байт вместо длинной строки)
+        # индекс строится только после бэкфилла, так что его наличие в БД и значит «всё уже сделано»
+        if "url_hash_1" not in self.collection.index_information():
+            self._backfill_url_hash()
+            # старый уникальный индекс по длинной ссылке больше не нужен — не платим за него на каждом upsert
+            try:
+                self.collection.drop_index("source_url_1")
+            except OperationFailure:
+                pass
+            self.collection.create_index(
+                [("url_hash", ASCENDING)],
+                unique=True,
+                # документы без url_hash (например, без source_url) не должны ломать уникальность
+                partialFilterExpression={"url_hash": {"$exists": True}},
+            )
+
+    @staticmethod
+    def _url_hash(source_url: str) -> bytes:
+        return hashlib.sha1(source_url.encode("utf-8")).digest()
+
+    def _backfill_url_hash(self):
+        # статьи, сохранённые до появления url_hash, иначе задублируются при повторном краулинге
+        cursor = self.collection.find(
+            {"url_hash": {"$exists": False}, "source_url": {"$type": "string"}},
+            {"source_url": 1},
+        )
+        ops = []
+        for d in cursor:
+            ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"url_hash": self._url_hash(d["source_url"])}}))
+            if len(ops) >= self.bulk_size:
+                self.collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
 
     def close_spider(self, spider):
-        if self.client:
-            self.client.close()
+        try:
+            if self.collection is not None:
+                self._flush(spider)
+        finally:
+            if self.client:
+                self.client.close()
+
+    def _flush(self, spider):
+        if not self._buf:
+            return
+        # забираем пачку заранее: упавшая пачка не должна повторно уходить с каждой следующей статьёй
+        buf, self._buf = self._buf, []
+        # ordered=False: сервер применяет операции независимо, одна ошибка не стопорит пачку
+        try:
+            self.collection.bulk_write(buf, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                spider.logger.error("Mongo bulk write error: %s", err)
 
     def process_item(self, item, spider):
         doc = dict(item)
 
         # минимальная нормализация
+        # header_photo_base64 всегда проставляет PhotoDownloaderPipeline
         doc.setdefault("header_photo_url", None)
-        doc.setdefault("header_photo_base64", None)
 
         # сервисные поля (не обязательны, но удобно)
         doc["parsed_at_utc"] = datetime.now(timezone.utc).isoformat()
 
-        try:
-            self.collection.insert_one(doc)
-        except DuplicateKeyError:
-            # если уже есть — можно игнорировать или обновлять
-            self.collection.update_one(
-                {"source_url": doc["source_url"]},
-                {"$set": doc},
-                upsert=True,
-            )
+        doc["url_hash"] = self._url_hash(doc["source_url"])
+
+        # upsert покрывает и новую статью, и дубль по ссылке; пишем пачками
+        self._buf.append(UpdateOne({"url_hash": doc["url_hash"]}, {"$set": doc}, upsert=True))
+        if len(self._buf) >= self.bulk_size:
+            self._flush(spider)
         return item
@@ -20,9 +20,12 @@ PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT = 60_000
 MONGO_HOST = "localhost"
 MONGO_PORT = 27017
 MONGO_COLLECTION = "kp_articles"
+MONGO_BULK_SIZE = 100  # сколько статей копим перед bulk_write
 
 # --- PhotoDownloaderPipeline ---
 RESULT_IMAGE_QUALITY = 35
+# 0 — 4:4:4, 1 — 4:2:2, 2 — 4:2:0 (меньше всего весит)
+JPEG_SUBSAMPLING = 2
 
 # Важно: сначала фото (меньший номер), потом Mongo (больший номер)
 ITEM_PIPELINES = {
@@ -30,9 +33,13 @@ ITEM_PIPELINES = {
     "kp.pipelines.MongoPipeline": 200,
 }
 
-# Рекомендуемо (чтобы не перегружать сайт)
-CONCURRENT_REQUESTS = 8
-DOWNLOAD_DELAY = 0.2
+# Статьи качаются без Playwright, упираемся в сеть — поэтому держим много запросов параллельно,
+# а вежливость к сайту обеспечивает AutoThrottle (сам снижает темп при росте задержек)
+CONCURRENT_REQUESTS = 32
+CONCURRENT_REQUESTS_PER_DOMAIN = 32
+DOWNLOAD_DELAY = 0
+AUTOTHROTTLE_ENABLED = True
+AUTOTHROTTLE_TARGET_CONCURRENCY = 16.0
 
 DEFAULT_REQUEST_HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
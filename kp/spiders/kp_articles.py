@@ -4,6 +4,9 @@ from urllib.parse import urljoin
 
 from kp.items import KpArticleItem
 
+_WS = re.compile(r"\s+")
+_AUTHOR_SPLIT = re.compile(r"[,;&]")
+
 
 class KpArticlesSpider(scrapy.Spider):
     name = "kp_articles"
@@ -41,6 +44,9 @@ class KpArticlesSpider(scrapy.Spider):
         - после каждого клика собираем href из DOM (а не из исходного HTML ответа)
         """
         page = response.meta["playwright_page"]
+        # кнопка может иметь разные классы, поэтому ищем по тексту, включая "ещё";
+        # локатор создаём один раз и переиспользуем во всех итерациях
+        show_more = page.locator("button:has-text('Показать еще'), button:has-text('Показать ещё')").first
 
         def normalize_url(u: str) -> str:
             return (u or "").split("?")[0].strip()
@@ -67,12 +73,18 @@ class KpArticlesSpider(scrapy.Spider):
                 except Exception:
                     pass
 
-        async def collect_urls_from_dom():
-            # берем ССЫЛКИ прямо из DOM после JS-подгрузки
-            hrefs = await page.eval_on_selector_all(
-                "a[href*='/online/news/']",
-                "els => els.map(e => e.href)",
+        # сколько ссылок из DOM уже разобрали — дальше забираем только новый хвост
+        anchors_scanned = 0
+
+        async def collect_new_urls_from_dom():
+            # берем ССЫЛКИ прямо из DOM после JS-подгрузки, начиная с ещё не просмотренных
+            nonlocal anchors_scanned
+            hrefs = await page.evaluate(
+                "(prev) => Array.from(document.querySelectorAll(\"a[href*='/online/news/']\"))"
+                ".slice(prev).map(e => e.href)",
+                anchors_scanned,
             )
+            anchors_scanned += len(hrefs or [])
             urls = []
             for u in hrefs or []:
                 u = normalize_url(u)
@@ -81,16 +93,14 @@ class KpArticlesSpider(scrapy.Spider):
             return urls
 
         async def click_show_more_and_wait(prev_anchor_count: int):
-            # кнопка может иметь разные классы, поэтому ищем по тексту, включая "ещё"
-            btn = page.locator("button:has-text('Показать еще'), button:has-text('Показать ещё')").first
-            if await btn.count() == 0:
+            if await show_more.count() == 0:
                 return False
 
             await try_dismiss_overlays()
 
             # докручиваем до кнопки и кликаем принудительно
             try:
-                await btn.scroll_into_view_if_needed(timeout=10_000)
+                await show_more.scroll_into_view_if_needed(timeout=10_000)
             except Exception:
                 try:
                     await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
@@ -98,7 +108,7 @@ class KpArticlesSpider(scrapy.Spider):
                     return False
 
             try:
-                await btn.click(timeout=10_000, force=True)
+                await show_more.click(timeout=10_000, force=True)
             except Exception:
                 return False
 
@@ -125,13 +135,13 @@ class KpArticlesSpider(scrapy.Spider):
         ordered_urls = []
 
         try:
-            await page.wait_for_selector("button:has-text('Показать еще'), button:has-text('Показать ещё')", timeout=30_000)
+            await show_more.wait_for(timeout=30_000)
         except Exception:
             # даже если кнопка не найдена, соберём то, что есть
             pass
 
         # первичный сбор
-        for u in await collect_urls_from_dom():
+        for u in await collect_new_urls_from_dom():
             if u not in seen:
                 seen.add(u)
                 ordered_urls.append(u)
@@ -143,15 +153,15 @@ class KpArticlesSpider(scrapy.Spider):
 
         while len(ordered_urls) < self.posts_limit and clicks < self.MAX_SHOW_MORE_CLICKS and stalls < self.STALL_LIMIT:
             prev_unique = len(ordered_urls)
-            prev_anchor_count = await page.locator("a[href*='/online/news/']").count()
-
-            ok = await click_show_more_and_wait(prev_anchor_count)
+            # после последнего сбора anchors_scanned и есть текущее число ссылок в DOM —
+            # отдельный count() через CDP не нужен
+            ok = await click_show_more_and_wait(anchors_scanned)
             if not ok:
                 break
             clicks += 1
 
-            # после клика — собираем текущие ссылки из DOM
-            current = await collect_urls_from_dom()
+            # после клика — собираем только появившиеся ссылки из DOM
+            current = await collect_new_urls_from_dom()
             for u in current:
                 if u not in seen:
                     seen.add(u)
@@ -180,7 +190,7 @@ class KpArticlesSpider(scrapy.Spider):
 
     def parse_article(self, response):
         def clean_text(s: str) -> str:
-            return re.sub(r"\s+", " ", (s or "")).strip()
+            return _WS.sub(" ", s or "").strip()
 
         source_url = response.url.split("?")[0]
 
@@ -203,19 +213,19 @@ class KpArticlesSpider(scrapy.Spider):
 
         kw_str = response.xpath("//meta[@name='keywords']/@content").get()
         if kw_str:
-            keywords = [clean_text(x) for x in kw_str.split(",") if clean_text(x)]
+            keywords = [c for x in kw_str.split(",") if (c := clean_text(x))]
         else:
             keywords = response.xpath("//a[contains(@href,'/tag/')]/text()").getall()
-            keywords = [clean_text(x) for x in keywords if clean_text(x)]
+            keywords = [c for x in keywords if (c := clean_text(x))]
 
         author_meta = response.xpath("//meta[@name='author']/@content").get()
         if author_meta:
-            authors = [clean_text(x) for x in re.split(r",|;|&", author_meta) if clean_text(x)]
+            authors = [c for x in _AUTHOR_SPLIT.split(author_meta) if (c := clean_text(x))]
         else:
             authors = response.xpath(
                 "//*[contains(@class,'author') or contains(@class,'Authors') or contains(@class,'authors')]//text()"
             ).getall()
-            authors = [clean_text(x) for x in authors if clean_text(x)]
+            authors = [c for x in authors if (c := clean_text(x))]
             authors = list(dict.fromkeys(authors))
 
         # Берём всё содержимое первого div data-gtm-el="content-body"
@@ -225,7 +235,7 @@ class KpArticlesSpider(scrapy.Spider):
             ".//text()[not(ancestor::div[@data-wide='true'])]"
             "[not(ancestor::script) and not(ancestor::style)]"
         ).getall()
-        parts = [clean_text(x) for x in parts if clean_text(x)]
+        parts = [c for x in parts if (c := clean_text(x))]
         article_text = "\n".join(parts)
 
         yield KpArticleItem(
@@ -3,13 +3,13 @@ from __future__ import annotations
 
 from http import HTTPStatus
 from os import getenv
-from typing import Any, Mapping
+from typing import AsyncIterator
 
 import html
-import pymongo
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.collection import AsyncCollection
 from fastapi import Depends, FastAPI, HTTPException, Query
-from fastapi.concurrency import run_in_threadpool
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 
@@ -27,7 +27,10 @@ class NewsArticle(BaseModel):
 
 app = FastAPI(title="News Page Generator service", description="Study Case Example")
 
-_mongo_client: pymongo.MongoClient | None = None
+_mongo_client: AsyncMongoClient | None = None
+# имена БД и коллекции не меняются за время жизни процесса — читаем env один раз в startup
+_mongo_db_name: str | None = None
+_collection_name: str | None = None
 
 
 def _env(name: str, default: str | None = None) -> str | None:
@@ -48,87 +51,63 @@ def _build_mongo_uri() -> str:
     return f"mongodb://{mongo_user}:{mongo_password}@{mongo_host}:{mongo_port}/?authSource={mongo_auth_source}"
 
 
+def _resolve_collection_names() -> tuple[str, str]:
+    # Совместимо с вашими переменными из Scrapy:
+    mongo_db = _env("MONGO_DB", "items")
+    collection = _env("MONGO_COLLECTION", "kp_articles")
+
+    # (опционально) совместимость с альтернативными именами:
+    mongo_db = _env("MONGO_DATABASE", mongo_db)
+    collection = _env("MONGO_DATABASE_COLLECTION", collection)
+
+    return mongo_db, collection
+
+
 @app.on_event("startup")
-def startup():
-    global _mongo_client
-    _mongo_client = pymongo.MongoClient(
+async def startup():
+    global _mongo_client, _mongo_db_name, _collection_name
+    _mongo_db_name, _collection_name = _resolve_collection_names()
+    # асинхронный клиент pymongo работает прямо в event loop — без прыжков в threadpool на каждый запрос
+    _mongo_client = AsyncMongoClient(
         _build_mongo_uri(),
         serverSelectionTimeoutMS=5000,
     )
     # Проверяем соединение сразу, чтобы не ловить 500 “внезапно”
-    _mongo_client.admin.command("ping")
+    await _mongo_client.admin.command("ping")
 
 
 @app.on_event("shutdown")
-def shutdown():
+async def shutdown():
     global _mongo_client
     if _mongo_client is not None:
-        _mongo_client.close()
+        await _mongo_client.close()
         _mongo_client = None
 
 
-def get_collection() -> pymongo.collection.Collection[Mapping[str, Any] | Any]:
+async def get_collection() -> AsyncCollection:
     if _mongo_client is None:
         raise RuntimeError("Mongo client is not initialized")
 
-    # Совместимо с вашими переменными из Scrapy:
-    mongo_db = _env("MONGO_DB", "items")
-    collection = _env("MONGO_COLLECTION", "kp_articles")
+    return _mongo_client[_mongo_db_name][_collection_name]
 
-    # (опционально) совместимость с альтернативными именами:
-    mongo_db = _env("MONGO_DATABASE", mongo_db)
-    collection = _env("MONGO_DATABASE_COLLECTION", collection)
-
-    return _mongo_client[mongo_db][collection]
-
-
-def _e(s: str | None) -> str:
-    return html.escape(s or "", quote=True)
 
+# Только поля, нужные NewsArticle: не тащим из Mongo лишнее
+_ARTICLE_PROJECTION: dict[str, int] = {
+    "_id": 0,
+    "title": 1,
+    "description": 1,
+    "article_text": 1,
+    "publication_datetime": 1,
+    "header_photo_url": 1,
+    "header_photo_base64": 1,
+    "keywords": 1,
+    "authors": 1,
+    "source_url": 1,
+}
 
-async def _sample_articles(col, size: int) -> list[NewsArticle]:
-    # Вынесено в threadpool, чтобы не блокировать event loop
-    def _do():
-        total = col.count_documents({})
-        if total == 0:
-            return []
-
-        s = min(size, total)
-
-        docs = list(
-            col.aggregate(
-                [
-                    {"$sample": {"size": s}},
-                    {"$project": {"_id": 0}},
-                ]
-            )
-        )
-        out: list[NewsArticle] = []
-        for d in docs:
-            d.pop("_id", None)
-            try:
-                out.append(NewsArticle(**d))
-            except Exception:
-                continue
-        return out
-
-    return await run_in_threadpool(_do)
-
-
-@app.get("/articles", tags=["HTML Article Manager"])
-async def get_random_articles_in_html(
-    col=Depends(get_collection),
-    size: int = Query(10, ge=1, le=500),
-) -> HTMLResponse:
-    articles = await _sample_articles(col, size)
-    if not articles:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_FOUND,
-            detail="There is no any articles",
-        )
 
-    html_parts: list[str] = [
-        """<!doctype html>
+# Шапка и хвост страницы не меняются — кодируем в utf-8 один раз при импорте
+_HTML_HEAD = """<!doctype html>
 <html>
 <head>
   <meta charset="utf-8"/>
@@ -147,34 +126,99 @@ async def get_random_articles_in_html(
 </head>
 <body>
   <h1>Сводка новостей</h1>
-"""
-    ]
+""".encode("utf-8")
+
+_HTML_TAIL = b"</body></html>"
 
-    for a in articles:
-        html_parts.append(
-            f"""
+# Шаблоны карточки статьи: одна %-подстановка на статью
+_ARTICLE_TMPL = """
   <div class="article">
-    <div class="title">{_e(a.title)}</div>
-    <div class="description">{_e(a.description)}</div>
-    <div class="article_text">{_e(a.article_text)}</div>
-    <div class="meta"><b>Дата публикации:</b> {_e(a.publication_datetime)}</div>
-    <div class="meta"><b>Ключевые слова:</b> {_e(", ".join(a.keywords))}</div>
-    <div class="meta"><b>Авторы:</b> {_e(", ".join(a.authors))}</div>
+    <div class="title">%s</div>
+    <div class="description">%s</div>
+    <div class="article_text">%s</div>
+    <div class="meta"><b>Дата публикации:</b> %s</div>
+    <div class="meta"><b>Ключевые слова:</b> %s</div>
+    <div class="meta"><b>Авторы:</b> %s</div>
     <div class="meta source_url"><b>Ссылка на источник:</b>
-      <a href="{_e(a.source_url)}" target="_blank" rel="noreferrer">{_e(a.source_url)}</a>
+      <a href="%s" target="_blank" rel="noreferrer">%s</a>
     </div>
+%s  </div>
 """
-        )
-        if a.header_photo_base64:
-            html_parts.append(f"""    <img src="data:image/jpeg;base64,{a.header_photo_base64}" alt="header photo"/>""")
-            if a.header_photo_url:
-                html_parts.append(
-                    f"""
-    <div class="meta source_url"><a href="{_e(a.header_photo_url)}" target="_blank" rel="noreferrer">Ссылка на фото</a></div>
+
+_PHOTO_TMPL = """    <img src="data:image/jpeg;base64,%s" alt="header photo"/>"""
+
+_PHOTO_LINK_TMPL = """
+    <div class="meta source_url"><a href="%s" target="_blank" rel="noreferrer">Ссылка на фото</a></div>
 """
-                )
-        html_parts.append("  </div>\n")
 
-    html_parts.append("</body></html>")
 
-    return HTMLResponse(content="".join(html_parts), status_code=200)
+def _e(s: str | None) -> str:
+    return html.escape(s or "", quote=True)
+
+
+async def _sample_articles(col, size: int, include_photo: bool = True) -> AsyncIterator[NewsArticle]:
+    projection = dict(_ARTICLE_PROJECTION)
+    if not include_photo:
+        # base64 фото — самое тяжёлое поле документа
+        del projection["header_photo_base64"]
+
+    # $sample сам вернёт не больше, чем есть в коллекции — count_documents не нужен.
+    # Курсор читаем лениво, прямо в event loop
+    cursor = await col.aggregate(
+        [
+            {"$sample": {"size": size}},
+            {"$project": projection},
+        ]
+    )
+    async for d in cursor:
+        d.pop("_id", None)
+        try:
+            yield NewsArticle(**d)
+        except Exception:
+            continue
+
+
+def _render_article(a: NewsArticle) -> str:
+    photo = ""
+    if a.header_photo_base64:
+        photo = _PHOTO_TMPL % a.header_photo_base64
+        if a.header_photo_url:
+            photo += _PHOTO_LINK_TMPL % _e(a.header_photo_url)
+    source_url = _e(a.source_url)
+    return _ARTICLE_TMPL % (
+        _e(a.title),
+        _e(a.description),
+        _e(a.article_text),
+        _e(a.publication_datetime),
+        _e(", ".join(a.keywords)),
+        _e(", ".join(a.authors)),
+        source_url,
+        source_url,
+        photo,
+    )
+
+
+@app.get("/articles", tags=["HTML Article Manager"], response_class=HTMLResponse)
+async def get_random_articles_in_html(
+    col=Depends(get_collection),
+    size: int = Query(10, ge=1, le=500),
+    include_photo: bool = Query(True),
+) -> StreamingResponse:
+    articles = _sample_articles(col, size, include_photo)
+    # первую статью ждём до начала ответа — иначе 404 уже не отдать
+    first = await anext(articles, None)
+    if first is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="There is no any articles",
+        )
+
+    # Отдаём страницу по частям: клиент получает начало, пока дочитываем курсор
+    async def _render():
+        yield _HTML_HEAD
+        yield _render_article(first)
+        async for a in articles:
+            yield _render_article(a)
+        yield _HTML_TAIL
+
+    return StreamingResponse(_render(), status_code=200, media_type="text/html")